@@ -1,16 +1,51 @@
 import re
 import os
-from typing import TypedDict, List, Dict, Set
-from hf_client import HFChatClient
+import bisect
+from typing import TypedDict, List, Dict, Iterable, Iterator, Set, Tuple
+
+try:
+    import ahocorasick
+except ImportError:  # optional C accelerator; see the regex fallback below
+    ahocorasick = None
 
 from langgraph.graph import StateGraph, END
 
 # --- regex extractors ---
-RE_URL = re.compile(r"(https?://[^\s]+)", re.IGNORECASE)
-RE_SHORT = re.compile(r"\b(?:bit\.ly|tinyurl\.com|t\.co|goo\.gl|cutt\.ly|rb\.gy)/[A-Za-z0-9_-]+\b", re.IGNORECASE)
-RE_UPI = re.compile( r"(?<![\w.-])([a-zA-Z0-9._-]{2,})@([a-zA-Z0-9]{2,})(?![\w.-])")
-RE_PHONE = re.compile(r"\b(?:\+91[-\s]?)?[6-9]\d{9}\b")
-RE_BANK_AC = re.compile(r"\b\d{9,18}\b")
+# One alternation scanned with a single finditer; m.lastgroup says which artifact matched.
+# Alternatives can't overlap, but the per-type semantics must match independent scans:
+# a link swallows everything up to the next whitespace (?pa=9876543210@ybl, wa.me/91...),
+# a mob@bank UPI contains a phone/account, and a mobile number is also a 9-18 digit
+# account. So each match is re-scanned with the narrower patterns in NESTED_PATTERNS.
+# Only a scheme URL's embedded shortener link is not recorded a second time.
+SHORTENER_HOSTS = frozenset({"bit.ly", "tinyurl.com", "t.co", "goo.gl", "cutt.ly", "rb.gy"})
+
+_UPI = r"(?<![\w.-])[a-zA-Z0-9._-]{2,}@[a-zA-Z0-9]{2,}(?![\w.-])"
+_PHONE = r"\b(?:\+91[-\s]?)?[6-9]\d{9}\b"
+_BANK_AC = r"\b\d{9,18}\b"
+
+RE_ALL = re.compile(
+    r"(?P<url>https?://[^\s]+)"
+    r"|(?P<short>\b(?:" + "|".join(re.escape(h) for h in sorted(SHORTENER_HOSTS)) + r")/[A-Za-z0-9_-]+\b)"
+    rf"|(?P<upi>{_UPI})|(?P<phone>{_PHONE})|(?P<ac>{_BANK_AC})",
+    re.IGNORECASE,
+)
+RE_UPI = re.compile(_UPI)
+RE_PHONE = re.compile(_PHONE)
+RE_BANK_AC = re.compile(_BANK_AC)
+
+_LINK_PARTS = (("upi", RE_UPI), ("phone", RE_PHONE), ("ac", RE_BANK_AC))
+NESTED_PATTERNS = {
+    "url": _LINK_PARTS,
+    "short": _LINK_PARTS,
+    "upi": (("phone", RE_PHONE), ("ac", RE_BANK_AC)),
+    "phone": (("ac", RE_BANK_AC),),
+    "ac": (),
+}
+
+# Every RE_ALL alternative needs one of these characters (URLs and short links a "/",
+# UPI an "@", phone/account a digit); ASCII messages with none of them skip the regex.
+# \d also matches non-ASCII digits (e.g. Devanagari), so non-ASCII text always runs it.
+ARTIFACT_TRIGGER_CHARS = frozenset("@/0123456789")
 
 SUSPICIOUS_KEYWORDS = [
     "urgent", "verify", "account blocked", "blocked today", "suspended", "freeze",
@@ -18,7 +53,96 @@ SUSPICIOUS_KEYWORDS = [
     "upi", "bank account", "share details", "immediately"
 ]
 
+HIGH_RISK_PHRASES = (
+    "otp", "cvv", "pin", "verify immediately", "blocked today",
+    "account will be blocked", "share your upi", "click the link",
+    "refund", "cashback", "kyc update", "suspended"
+)
+
+def _keyword_weights() -> Dict[str, float]:
+    # Phrases present in both lists carry the summed weight.
+    weights: Dict[str, float] = {}
+    for p in HIGH_RISK_PHRASES:
+        weights[p] = weights.get(p, 0.0) + 0.18
+    for kw in SUSPICIOUS_KEYWORDS:
+        weights[kw] = weights.get(kw, 0.0) + 0.05
+    return weights
+
+KEYWORD_WEIGHTS = _keyword_weights()
+
+# payload per keyword: (weight, keyword, is_suspicious_keyword)
+KEYWORD_PAYLOADS = {kw: (w, kw, kw in SUSPICIOUS_KEYWORDS) for kw, w in KEYWORD_WEIGHTS.items()}
+
+if ahocorasick is not None:
+    def _build_keyword_automaton() -> "ahocorasick.Automaton":
+        ac = ahocorasick.Automaton()
+        for kw, payload in KEYWORD_PAYLOADS.items():
+            ac.add_word(kw, payload)
+        ac.make_automaton()
+        return ac
+
+    KEYWORD_AC = _build_keyword_automaton()
+
+    def _match_keywords(lower: str) -> Dict[str, tuple]:
+        """Single Aho-Corasick pass over lowercased text -> {keyword: payload}, deduped."""
+        return {payload[1]: payload for _, payload in KEYWORD_AC.iter(lower)}
+else:
+    # Fallback without pyahocorasick: one compiled alternation run by _sre's C loop.
+    # The lookahead reports the longest keyword starting at each position (longest
+    # alternatives first); any shorter keyword starting there is a prefix of it, so
+    # expanding through KEYWORD_PREFIXES yields the same hits as the automaton.
+    RE_KW = re.compile(
+        "(?=(" + "|".join(re.escape(k) for k in sorted(KEYWORD_WEIGHTS, key=len, reverse=True)) + "))"
+    )
+    KEYWORD_PREFIXES = {
+        kw: [KEYWORD_PAYLOADS[k] for k in KEYWORD_WEIGHTS if kw.startswith(k)]
+        for kw in KEYWORD_WEIGHTS
+    }
+
+    def _match_keywords(lower: str) -> Dict[str, tuple]:
+        """Single regex pass over lowercased text -> {keyword: payload}, deduped."""
+        return {
+            payload[1]: payload
+            for m in RE_KW.finditer(lower)
+            for payload in KEYWORD_PREFIXES[m.group(1)]
+        }
+
 FINALIZE_MIN_ARTIFACTS = int(os.getenv("FINALIZE_MIN_ARTIFACTS", "3"))
+# SMS is 160 chars and WhatsApp caps at 4096; bound the scan so giant payloads can't
+# make every message pay for long digit runs or huge keyword walks.
+MAX_SCAN_CHARS = int(os.getenv("MAX_SCAN_CHARS", "2048"))
+
+class SortedSet:
+    """String set that keeps a sorted list alongside it (bisect.insort on add), so
+    reading the sorted view never sorts."""
+
+    __slots__ = ("_items", "_sorted")
+
+    def __init__(self, items: Iterable[str] = ()) -> None:
+        self._items = set(items)
+        self._sorted: List[str] = sorted(self._items)
+
+    def add(self, item: str) -> None:
+        if item not in self._items:
+            self._items.add(item)
+            bisect.insort(self._sorted, item)
+
+    def update(self, items: Iterable[str]) -> None:
+        for item in items:
+            self.add(item)
+
+    def sorted(self) -> List[str]:
+        # The live list -- callers must not mutate it.
+        return self._sorted
+
+    def __contains__(self, item: object) -> bool:
+        return item in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._items)
 
 class AgentState(TypedDict, total=False):
     sessionId: str
@@ -30,83 +154,86 @@ class AgentState(TypedDict, total=False):
     confidence: float
     stage: str
 
-    bankAccounts: Set[str]
-    upiIds: Set[str]
-    phishingLinks: Set[str]
-    phoneNumbers: Set[str]
-    suspiciousKeywords: Set[str]
+    bankAccounts: SortedSet
+    upiIds: SortedSet
+    phishingLinks: SortedSet
+    phoneNumbers: SortedSet
+    suspiciousKeywords: SortedSet
+    keywordHits: Set[str]  # keywords/phrases matched in incoming_text only (not session-wide)
 
     reply: str
     shouldFinalize: bool
     agentNotes: str
 
-hf_client = HFChatClient()
+def scan_text(text: str) -> Tuple[float, List[str], List[str], List[str], List[str], Dict[str, tuple]]:
+    """All pattern matching for one message, with no state access.
+
+    Returns (score, links, upis, phones, accounts, keyword_hits); keyword_hits maps
+    each matched keyword to its KEYWORD_PAYLOADS entry. Kept pure so the whole
+    matching workload sits behind one call.
+    """
+    # Hard cap for every pass. If it splits a token, matches running into the cut are
+    # partial: a cut link still counts toward the score (its host is intact) but is not
+    # recorded, and cut numbers/UPI IDs are dropped, so no truncated value becomes intel.
+    cut_mid_token = len(text) > MAX_SCAN_CHARS and not text[MAX_SCAN_CHARS].isspace()
+    text = text[:MAX_SCAN_CHARS]
+    end = len(text)
+
+    links, upis, phones, accounts = [], [], [], []
+    found = {"upi": upis, "phone": phones, "ac": accounts}
+    link_seen = False
+    if text.isascii() and ARTIFACT_TRIGGER_CHARS.isdisjoint(text):
+        matches = ()
+    else:
+        matches = RE_ALL.finditer(text)
+    for m in matches:
+        kind, value = m.lastgroup, m.group()
+        partial = cut_mid_token and m.end() == end
+        if kind == "url" or kind == "short":
+            link_seen = True
+            if not partial:
+                links.append(value.strip().rstrip(").,;"))
+        elif not partial:
+            found[kind].append(value)
+        for sub_kind, pattern in NESTED_PATTERNS[kind]:
+            for sub in pattern.finditer(value):
+                if not (partial and sub.end() == len(value)):
+                    found[sub_kind].append(sub.group())
+
+    hits = _match_keywords(text.lower())
 
-def _score_scam(text: str) -> float:
-    t = text.lower()
     score = 0.0
-
-    high = [
-        "otp", "cvv", "pin", "verify immediately", "blocked today",
-        "account will be blocked", "share your upi", "click the link",
-        "refund", "cashback", "kyc update", "suspended"
-    ]
-    for p in high:
-        if p in t:
-            score += 0.18
-
-    for kw in SUSPICIOUS_KEYWORDS:
-        if kw in t:
-            score += 0.05
-
-    if RE_URL.search(text) or RE_SHORT.search(text):
+    for weight, _, _ in hits.values():
+        score += weight
+    if link_seen:
         score += 0.25
-    if RE_UPI.search(text):
+    if upis:
         score += 0.25
-    if RE_PHONE.search(text):
+    if phones:
         score += 0.10
 
-    return min(score, 1.0)
+    return min(score, 1.0), links, upis, phones, accounts, hits
+
+def node_extract(state: AgentState) -> AgentState:
+    """Detect + extract in one pass: scan the message once, merge the artifacts into
+    the session intel sets and score the message from what it matched."""
+    conf, links, upis, phones, accounts, hits = scan_text(state["incoming_text"])
+
+    state.setdefault("bankAccounts", SortedSet()).update(accounts)
+    state.setdefault("upiIds", SortedSet()).update(upis)
+    state.setdefault("phishingLinks", SortedSet()).update(links)
+    state.setdefault("phoneNumbers", SortedSet()).update(phones)
+    state.setdefault("suspiciousKeywords", SortedSet()).update(
+        kw for kw, (_, _, suspicious) in hits.items() if suspicious
+    )
+    state["keywordHits"] = set(hits)
 
-def node_detect(state: AgentState) -> AgentState:
-    conf = _score_scam(state["incoming_text"])
     scam = conf >= 0.35
     state["confidence"] = conf
     state["scamDetected"] = scam
     state["stage"] = "engage" if scam else "observe"
     return state
 
-def node_extract(state: AgentState) -> AgentState:
-    text = state["incoming_text"]
-
-    state.setdefault("bankAccounts", set())
-    state.setdefault("upiIds", set())
-    state.setdefault("phishingLinks", set())
-    state.setdefault("phoneNumbers", set())
-    state.setdefault("suspiciousKeywords", set())
-
-    for m in RE_URL.findall(text):
-        state["phishingLinks"].add(m.strip().rstrip(").,;"))
-    for m in RE_SHORT.findall(text):
-        state["phishingLinks"].add(m.strip().rstrip(").,;"))
-
-    for m in RE_UPI.findall(text):
-        state["upiIds"].add(m)
-
-    for m in RE_PHONE.findall(text):
-        state["phoneNumbers"].add(m.strip())
-
-    for m in RE_BANK_AC.findall(text):
-        if len(m) >= 9:
-            state["bankAccounts"].add(m)
-
-    lower = text.lower()
-    for kw in SUSPICIOUS_KEYWORDS:
-        if kw in lower:
-            state["suspiciousKeywords"].add(kw)
-
-    return state
-
 def _should_finalize(state: AgentState) -> bool:
     strong = 0
     if len(state.get("phishingLinks", set())) > 0:
@@ -123,30 +250,38 @@ def node_decide(state: AgentState) -> AgentState:
     state["shouldFinalize"] = bool(state.get("scamDetected")) and _should_finalize(state)
     return state
 
+SYSTEM_PROMPT = (
+    "You are a normal person in India replying over SMS/WhatsApp. "
+    "You are anxious and slightly confused, willing to cooperate. "
+    "Goal: ask questions that make the other person reveal details (UPI ID, phone number, link, bank account, steps). "
+    "Never share OTP, PIN, CVV, passwords or any real personal info. "
+    "Keep replies short (1-2 sentences), natural, non-robotic."
+)
+DEFAULT_HINT = "Ask which bank, exact steps, and link/UPI shown."
+
 async def node_reply_llm(state: AgentState, hf_chat) -> AgentState:
     if not state.get("scamDetected"):
         state["reply"] = "Sorry—who is this and which bank/service is this about? I didn’t request anything."
         return state
 
-    system = (
-        "You are a normal person in India replying over SMS/WhatsApp. "
-        "You are anxious and slightly confused, willing to cooperate. "
-        "Goal: ask questions that make the other person reveal details (UPI ID, phone number, link, bank account, steps). "
-        "Never share OTP, PIN, CVV, passwords or any real personal info. "
-        "Keep replies short (1-2 sentences), natural, non-robotic."
-    )
-
-    artifacts = []
-    if state.get("phishingLinks"):
-        artifacts.append("They already sent a link; ask to resend / domain name.")
-    if state.get("upiIds") or "upi" in state["incoming_text"].lower():
-        artifacts.append("Try to get their UPI ID / receiver name shown on screen.")
-    if "otp" in state["incoming_text"].lower():
-        artifacts.append("Say OTP not received; ask steps/link instead.")
-    hint = " ".join(artifacts) if artifacts else "Ask which bank, exact steps, and link/UPI shown."
+    hits = state.get("keywordHits", set())
+    has_link = bool(state.get("phishingLinks"))
+    has_upi = bool(state.get("upiIds")) or "upi" in hits
+    has_otp = "otp" in hits
+    if has_link or has_upi or has_otp:
+        artifacts = []
+        if has_link:
+            artifacts.append("They already sent a link; ask to resend / domain name.")
+        if has_upi:
+            artifacts.append("Try to get their UPI ID / receiver name shown on screen.")
+        if has_otp:
+            artifacts.append("Say OTP not received; ask steps/link instead.")
+        hint = " ".join(artifacts)
+    else:
+        hint = DEFAULT_HINT
 
     messages = [
-        {"role": "system", "content": system},
+        {"role": "system", "content": SYSTEM_PROMPT},
         {"role": "user", "content": f"Latest scammer message: {state['incoming_text']}\n\nGuidance: {hint}"}
     ]
 
@@ -160,20 +295,21 @@ async def node_reply_llm(state: AgentState, hf_chat) -> AgentState:
     return state
 
 def build_graph(hf_client):
+    """LangGraph wiring of the pipeline. main.py runs the same nodes inline on the hot
+    path; this is kept for tracing/visualizing the workflow."""
     g = StateGraph(AgentState)
-    g.add_node("detect", node_detect)
     g.add_node("extract", node_extract)
     g.add_node("decide", node_decide)
 
     async def reply_node(state: AgentState) -> AgentState:
         return await node_reply_llm(state, hf_client.chat)
 
-    g.add_node("reply", reply_node)
+    # Node names must not collide with state keys ("reply" is one).
+    g.add_node("respond", reply_node)
 
-    g.set_entry_point("detect")
-    g.add_edge("detect", "extract")
+    g.set_entry_point("extract")
     g.add_edge("extract", "decide")
-    g.add_edge("decide", "reply")
-    g.add_edge("reply", END)
+    g.add_edge("decide", "respond")
+    g.add_edge("respond", END)
 
     return g.compile()
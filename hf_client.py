@@ -14,10 +14,19 @@ class HFChatClient:
     def __init__(self) -> None:
         if not HF_TOKEN:
             raise RuntimeError("HF_TOKEN env var not set")
+        # Long-lived pooled client: keep-alive avoids a TCP+TLS handshake per LLM call,
+        # and HTTP/2 multiplexes concurrent calls over one connection.
+        self._client = httpx.AsyncClient(
+            timeout=HF_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=20, keepalive_expiry=30),
+            headers={"Authorization": f"Bearer {HF_TOKEN}"},
+            http2=True,
+        )
+
+    async def close(self) -> None:
+        await self._client.aclose()
 
     async def chat(self, messages: List[Dict[str, str]], max_tokens: int = 180) -> str:
-        headers = {"Authorization": f"Bearer {HF_TOKEN}"}
-
         # Many HF endpoints accept chat-style JSON (TGI-compatible).
         payload = {
             "inputs": {
@@ -28,24 +37,23 @@ class HFChatClient:
             }
         }
 
-        async with httpx.AsyncClient(timeout=HF_TIMEOUT_SECONDS) as client:
-            r = await client.post(API_URL, headers=headers, json=payload)
-            r.raise_for_status()
-            data = r.json()
+        r = await self._client.post(API_URL, json=payload)
+        r.raise_for_status()
+        data = r.json()
 
-            # Common response variants across backends:
-            # A) {"choices":[{"message":{"content":"..."}}]}
-            if isinstance(data, dict) and "choices" in data:
-                return (data["choices"][0]["message"].get("content") or "").strip()
+        # Common response variants across backends:
+        # A) {"choices":[{"message":{"content":"..."}}]}
+        if isinstance(data, dict) and "choices" in data:
+            return (data["choices"][0]["message"].get("content") or "").strip()
 
-            # B) [{"generated_text":"..."}]
-            if isinstance(data, list) and data and isinstance(data[0], dict):
-                if "generated_text" in data[0]:
-                    return (data[0].get("generated_text") or "").strip()
+        # B) [{"generated_text":"..."}]
+        if isinstance(data, list) and data and isinstance(data[0], dict):
+            if "generated_text" in data[0]:
+                return (data[0].get("generated_text") or "").strip()
 
-            # C) {"generated_text":"..."}
-            if isinstance(data, dict) and "generated_text" in data:
-                return (data.get("generated_text") or "").strip()
+        # C) {"generated_text":"..."}
+        if isinstance(data, dict) and "generated_text" in data:
+            return (data.get("generated_text") or "").strip()
 
-            # Fallback stringify (kept short)
-            return str(data)[:500].strip()
+        # Fallback stringify (kept short)
+        return str(data)[:500].strip()
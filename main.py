@@ -1,23 +1,28 @@
 import os
 import time
 import asyncio
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Dict, Optional, List
+from typing import AsyncIterator, Dict, Optional, List
 from typing_extensions import TypedDict
 
 import httpx
 from fastapi import FastAPI, Header, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
 
 from hf_client import HFChatClient
-from agent_graph import build_graph
+from agent_graph import SortedSet, node_extract, node_decide, node_reply_llm
 from dotenv import load_dotenv
 load_dotenv()
 
 API_KEY = os.getenv("HP_API_KEY", "CHANGE_ME")
 GUVI_CALLBACK_URL = "https://hackathon.guvi.in/api/updateHoneyPotFinalResult"
 GUVI_TIMEOUT_SECONDS = float(os.getenv("GUVI_TIMEOUT_SECONDS", "5"))
+SESSION_MAX = int(os.getenv("SESSION_MAX", "10000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_PURGE_INTERVAL_SECONDS = 60
 
 class Message(BaseModel):
     sender: str
@@ -36,36 +41,91 @@ class IncomingEvent(BaseModel):
     metadata: Optional[Metadata] = None
 
 # In-memory session storage. If you run multiple workers, use Redis for shared state.
-SESSIONS: Dict[str, dict] = {}
-LOCKS: Dict[str, asyncio.Lock] = {}
-GLOBAL_LOCK = asyncio.Lock()
+# Single event loop: dict lookups/inserts below never await, so no global lock is needed.
+# SESSIONS is kept in LRU order (oldest first) and capped at SESSION_MAX.
+SESSIONS: "OrderedDict[str, dict]" = OrderedDict()
+LOCKS: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+# Requests holding or waiting for a session's lock; such sessions are never evicted.
+INFLIGHT: Dict[str, int] = {}
 
 def now_ts() -> float:
     return time.time()
 
-async def get_lock(session_id: str) -> asyncio.Lock:
-    async with GLOBAL_LOCK:
-        if session_id not in LOCKS:
-            LOCKS[session_id] = asyncio.Lock()
-        return LOCKS[session_id]
-
-async def get_session(session_id: str) -> dict:
-    async with GLOBAL_LOCK:
-        if session_id not in SESSIONS:
-            SESSIONS[session_id] = {
-                "createdAt": now_ts(),
-                "updatedAt": now_ts(),
-                "totalMessagesExchanged": 0,
-                "finalized": False,
-                "agentNotes": "",
-                # intelligence sets for dedupe
-                "bankAccounts": set(),
-                "upiIds": set(),
-                "phishingLinks": set(),
-                "phoneNumbers": set(),
-                "suspiciousKeywords": set(),
-            }
-        return SESSIONS[session_id]
+def get_lock(session_id: str) -> asyncio.Lock:
+    return LOCKS[session_id]
+
+def _session_busy(session_id: str) -> bool:
+    # lock.locked() isn't enough: it is False between a release and the queued waiter
+    # resuming. Dropping the session then would hand the next request a fresh lock +
+    # dict, running concurrently with that waiter.
+    return INFLIGHT.get(session_id, 0) > 0
+
+def _drop_session(session_id: str) -> None:
+    SESSIONS.pop(session_id, None)
+    LOCKS.pop(session_id, None)
+
+def get_session(session_id: str) -> dict:
+    sess = SESSIONS.get(session_id)
+    if sess is not None:
+        SESSIONS.move_to_end(session_id)
+    else:
+        sess = SESSIONS[session_id] = {
+            "createdAt": now_ts(),
+            "updatedAt": now_ts(),
+            "totalMessagesExchanged": 0,
+            "finalized": False,
+            "agentNotes": "",
+            # intelligence sets for dedupe
+            "bankAccounts": SortedSet(),
+            "upiIds": SortedSet(),
+            "phishingLinks": SortedSet(),
+            "phoneNumbers": SortedSet(),
+            "suspiciousKeywords": SortedSet(),
+        }
+        excess = len(SESSIONS) - SESSION_MAX
+        if excess > 0:
+            victims = []
+            for sid in SESSIONS:
+                if not _session_busy(sid):
+                    victims.append(sid)
+                    if len(victims) == excess:
+                        break
+            for sid in victims:
+                _drop_session(sid)
+    return sess
+
+@asynccontextmanager
+async def hold_session(session_id: str) -> AsyncIterator[dict]:
+    """Serialize requests per session and yield its state; the session counts as busy
+    from before the lock wait until the lock is released."""
+    INFLIGHT[session_id] = INFLIGHT.get(session_id, 0) + 1
+    try:
+        async with get_lock(session_id):
+            yield get_session(session_id)
+    finally:
+        remaining = INFLIGHT[session_id] - 1
+        if remaining:
+            INFLIGHT[session_id] = remaining
+        else:
+            del INFLIGHT[session_id]
+
+def purge_expired_sessions() -> None:
+    # LRU order means the oldest sessions are at the front; stop at the first live one.
+    cutoff = now_ts() - SESSION_TTL_SECONDS
+    for session_id in list(SESSIONS):
+        if SESSIONS[session_id]["updatedAt"] >= cutoff:
+            break
+        if _session_busy(session_id):
+            continue
+        _drop_session(session_id)
+
+async def _purge_sessions_loop() -> None:
+    while True:
+        await asyncio.sleep(SESSION_PURGE_INTERVAL_SECONDS)
+        purge_expired_sessions()
+
+# Shared pooled client for GUVI callbacks (keep-alive across sessions)
+guvi_client = httpx.AsyncClient(timeout=GUVI_TIMEOUT_SECONDS, http2=True)
 
 async def send_guvi_callback(session_id: str, sess: dict) -> None:
     payload = {
@@ -73,33 +133,51 @@ async def send_guvi_callback(session_id: str, sess: dict) -> None:
         "scamDetected": True,
         "totalMessagesExchanged": sess["totalMessagesExchanged"],
         "extractedIntelligence": {
-            "bankAccounts": sorted(list(sess["bankAccounts"])),
-            "upiIds": sorted(list(sess["upiIds"])),
-            "phishingLinks": sorted(list(sess["phishingLinks"])),
-            "phoneNumbers": sorted(list(sess["phoneNumbers"])),
-            "suspiciousKeywords": sorted(list(sess["suspiciousKeywords"])),
+            "bankAccounts": sess["bankAccounts"].sorted(),
+            "upiIds": sess["upiIds"].sorted(),
+            "phishingLinks": sess["phishingLinks"].sorted(),
+            "phoneNumbers": sess["phoneNumbers"].sorted(),
+            "suspiciousKeywords": sess["suspiciousKeywords"].sorted(),
         },
         "agentNotes": sess.get("agentNotes") or "Scammer used urgency + verification tactics; extracted artifacts."
     }
 
-    async with httpx.AsyncClient(timeout=GUVI_TIMEOUT_SECONDS) as client:
-        r = await client.post(GUVI_CALLBACK_URL, json=payload)
-        if r.status_code >= 400:
-            sess["agentNotes"] = (sess.get("agentNotes", "") + " ") + f"GUVI callback failed: {r.status_code}"
+    r = await guvi_client.post(GUVI_CALLBACK_URL, json=payload)
+    if r.status_code >= 400:
+        sess["agentNotes"] = (sess.get("agentNotes", "") + " ") + f"GUVI callback failed: {r.status_code}"
 
-app = FastAPI(title="Agentic Honeypot API", version="2.0.0")
+async def finalize_session(session_id: str, sess: dict) -> None:
+    try:
+        await send_guvi_callback(session_id, sess)
+    except Exception:
+        sess["agentNotes"] = (sess.get("agentNotes", "") + " ") + "GUVI callback exception."
+
+app = FastAPI(title="Agentic Honeypot API", version="2.0.0", default_response_class=ORJSONResponse)
 
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
-    return JSONResponse(status_code=500, content={"status": "error", "reply": "Something went wrong. Please try again."})
+    return ORJSONResponse(status_code=500, content={"status": "error", "reply": "Something went wrong. Please try again."})
 
 @app.get("/health")
 async def health():
     return {"status": "ok"}
 
-# Init HF + graph once at startup for low latency
+# Init HF once at startup for low latency
 hf_client = HFChatClient()
-graph = build_graph(hf_client)
+
+_purge_task: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def start_session_purge():
+    global _purge_task
+    _purge_task = asyncio.create_task(_purge_sessions_loop())
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    if _purge_task is not None:
+        _purge_task.cancel()
+    await hf_client.close()
+    await guvi_client.aclose()
 
 @app.post("/message")
 async def handle_message(
@@ -109,9 +187,7 @@ async def handle_message(
     if x_api_key != API_KEY:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    lock = await get_lock(event.sessionId)
-    async with lock:
-        sess = await get_session(event.sessionId)
+    async with hold_session(event.sessionId) as sess:
         sess["updatedAt"] = now_ts()
         sess["totalMessagesExchanged"] += 1
 
@@ -120,7 +196,7 @@ async def handle_message(
         for m in event.conversationHistory[-6:]:
             history_norm.append({"sender": m.sender, "text": m.text})
 
-        state_in = {
+        state = {
             "sessionId": event.sessionId,
             "incoming_text": event.message.text,
             "sender": event.message.sender,
@@ -133,27 +209,27 @@ async def handle_message(
             "suspiciousKeywords": sess["suspiciousKeywords"],
         }
 
-        state_out = await graph.ainvoke(state_in)
+        # Same nodes as build_graph(), called inline: the pipeline is strictly sequential,
+        # so skipping langgraph's per-node dispatch saves overhead on every message.
+        # The seeded intel sets are the session's own objects and are updated in place.
+        state = node_decide(node_extract(state))
 
-        # Persist intel back
-        sess["bankAccounts"] = state_out.get("bankAccounts", sess["bankAccounts"])
-        sess["upiIds"] = state_out.get("upiIds", sess["upiIds"])
-        sess["phishingLinks"] = state_out.get("phishingLinks", sess["phishingLinks"])
-        sess["phoneNumbers"] = state_out.get("phoneNumbers", sess["phoneNumbers"])
-        sess["suspiciousKeywords"] = state_out.get("suspiciousKeywords", sess["suspiciousKeywords"])
-
-        scam = bool(state_out.get("scamDetected", False))
-        conf = float(state_out.get("confidence", 0.0))
-        reply = state_out.get("reply") or "Okay—what should I do next?"
-        should_finalize = bool(state_out.get("shouldFinalize", False))
+        scam = bool(state.get("scamDetected", False))
+        conf = float(state.get("confidence", 0.0))
+        should_finalize = bool(state.get("shouldFinalize", False))
 
         if scam and (not sess["finalized"]) and should_finalize:
             sess["finalized"] = True
             sess["agentNotes"] = "Detected scam intent; extracted artifacts from conversation."
-            try:
-                await send_guvi_callback(event.sessionId, sess)
-            except Exception:
-                sess["agentNotes"] = (sess.get("agentNotes", "") + " ") + "GUVI callback exception."
+            # The callback payload doesn't depend on the reply, so overlap the two network calls.
+            state, _ = await asyncio.gather(
+                node_reply_llm(state, hf_client.chat),
+                finalize_session(event.sessionId, sess),
+            )
+        else:
+            state = await node_reply_llm(state, hf_client.chat)
+
+        reply = state.get("reply") or "Okay—what should I do next?"
 
         # Always include required format: status + reply
         resp = {
@@ -161,11 +237,11 @@ async def handle_message(
             "reply": reply,
             "scamDetected": scam,
             "extractedIntelligence": {
-                "bankAccounts": sorted(list(sess["bankAccounts"])),
-                "upiIds": sorted(list(sess["upiIds"])),
-                "phishingLinks": sorted(list(sess["phishingLinks"])),
-                "phoneNumbers": sorted(list(sess["phoneNumbers"])),
-                "suspiciousKeywords": sorted(list(sess["suspiciousKeywords"])),
+                "bankAccounts": sess["bankAccounts"].sorted(),
+                "upiIds": sess["upiIds"].sorted(),
+                "phishingLinks": sess["phishingLinks"].sorted(),
+                "phoneNumbers": sess["phoneNumbers"].sorted(),
+                "suspiciousKeywords": sess["suspiciousKeywords"].sorted(),
             },
             "agentState": {
                 "confidence": round(conf, 3),
@@ -173,4 +249,4 @@ async def handle_message(
                 "finalized": sess["finalized"],
             }
         }
-        return JSONResponse(status_code=200, content=resp)
+        return ORJSONResponse(status_code=200, content=resp)
@@ -0,0 +1,93 @@
+import importlib.util
+import random
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import agent_graph
+from agent_graph import MAX_SCAN_CHARS, _should_finalize, build_graph, node_extract, scan_text
+
+
+def test_artifacts_inside_links_are_extracted():
+    conf, links, upis, _, _, _ = scan_text(
+        "Pay now at https://pay.example.com/x?pa=scammer@ybl immediately"
+    )
+    assert links == ["https://pay.example.com/x?pa=scammer@ybl"]
+    assert upis == ["scammer@ybl"]
+    assert conf >= 0.35
+
+    _, _, _, _, accounts, _ = scan_text("https://evil.in/login?acct=123456789012")
+    assert accounts == ["123456789012"]
+
+    _, _, _, _, accounts, _ = scan_text("https://wa.me/919876543210")
+    assert accounts == ["919876543210"]
+
+
+
+# Confidence and finalization recorded from the original per-pattern detect/extract nodes.
+@pytest.mark.parametrize("text, confidence, finalize", [
+    ("Pay Rs 1 to 9876543210@ybl now", 0.35, True),
+    ("Call 9876543210 or visit https://bit.ly/abc", 0.35, True),
+    ("Pay at https://pay.example.com/x?pa=9876543210@ybl", 0.6, True),
+])
+def test_overlapping_artifacts_keep_baseline_scoring(text, confidence, finalize):
+    state = node_extract({"incoming_text": text})
+    assert state["confidence"] == pytest.approx(confidence)
+    assert state["scamDetected"]
+    assert _should_finalize(state) is finalize
+    assert "9876543210" in state["phoneNumbers"]
+    assert "9876543210" in state["bankAccounts"]
+
+
+def test_non_ascii_digits_bypass_the_prefilter():
+    devanagari_account = "९८७६५४३२१०९८"
+    _, _, _, _, accounts, _ = scan_text(f"account {devanagari_account} blocked today")
+    assert accounts == [devanagari_account]
+
+
+def test_scan_cap_does_not_cut_artifacts():
+    account = "123456789012345678"
+    filler = "x " * ((MAX_SCAN_CHARS - 10) // 2)
+    _, _, _, _, accounts, _ = scan_text(filler + account)
+    assert accounts == []
+
+    _, _, _, _, accounts, _ = scan_text(filler[:-20] + account + " tail")
+    assert accounts == [account]
+
+
+def test_long_leading_token_does_not_hide_a_scam():
+    conf, links, _, _, _, _ = scan_text("https://evil.example/" + "a" * 3000 + " urgent verify otp")
+    assert links == []  # cut link is scored but not recorded
+    assert conf == pytest.approx(0.25)
+
+    conf, _, _, _, _, hits = scan_text("URGENT-verify-otp-" + "x" * 3000)
+    assert {"urgent", "verify", "otp"} <= set(hits)
+    assert conf == pytest.approx(0.33)  # same as an uncapped scan of this text
+
+
+def test_regex_keyword_fallback_matches_substring_search(monkeypatch):
+    # Load a private copy of the module with pyahocorasick unavailable.
+    monkeypatch.setitem(sys.modules, "ahocorasick", None)
+    spec = importlib.util.spec_from_file_location("agent_graph_fallback", agent_graph.__file__)
+    fallback = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fallback)
+    assert fallback.ahocorasick is None
+
+    keywords = list(fallback.KEYWORD_WEIGHTS)
+    texts = ["your account blocked today, verify immediately", "click the link to share your upi"]
+    rng = random.Random(0)
+    vocab = keywords + ["the", "account", "blocked", "will", "be", "x"]
+    texts += ["".join(rng.choice(vocab) + rng.choice(["", " "]) for _ in range(8)) for _ in range(500)]
+
+    for text in texts:
+        hits = fallback._match_keywords(text)
+        assert set(hits) == {kw for kw in keywords if kw in text}, text
+        assert all(hits[kw] == fallback.KEYWORD_PAYLOADS[kw] for kw in hits)
+
+    assert {"account blocked", "blocked today"} <= set(fallback._match_keywords("account blocked today"))
+
+
+def test_build_graph_compiles():
+    graph = build_graph(SimpleNamespace(chat=None))
+    assert {"extract", "decide", "respond"} <= set(graph.get_graph().nodes)
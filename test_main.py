@@ -0,0 +1,69 @@
+import asyncio
+import os
+
+import pytest
+
+os.environ.setdefault("HF_TOKEN", "test-token")
+
+import main  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_sessions(monkeypatch):
+    monkeypatch.setattr(main, "SESSIONS", main.OrderedDict())
+    monkeypatch.setattr(main, "LOCKS", main.defaultdict(asyncio.Lock))
+    monkeypatch.setattr(main, "INFLIGHT", {})
+
+
+def test_lru_cap_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(main, "SESSION_MAX", 2)
+    main.get_session("a")
+    main.get_session("b")
+    main.get_session("a")
+    main.get_session("c")
+    assert list(main.SESSIONS) == ["a", "c"]
+
+
+def test_ttl_purge_drops_idle_sessions(monkeypatch):
+    monkeypatch.setattr(main, "SESSION_TTL_SECONDS", 60)
+    main.get_session("old")["updatedAt"] = main.now_ts() - 120
+    main.get_session("new")
+    main.purge_expired_sessions()
+    assert list(main.SESSIONS) == ["new"]
+
+
+def test_busy_session_survives_eviction_and_purge(monkeypatch):
+    monkeypatch.setattr(main, "SESSION_MAX", 1)
+    monkeypatch.setattr(main, "SESSION_TTL_SECONDS", 60)
+
+    async def scenario():
+        entered, release = asyncio.Event(), asyncio.Event()
+        seen = {}
+
+        async def holder():
+            async with main.hold_session("a") as sess:
+                seen["holder"] = sess
+                sess["updatedAt"] = main.now_ts() - 120
+                entered.set()
+                await release.wait()
+            # Lock released, queued waiter not resumed yet: "a" must still count as busy.
+            main.get_session("b")
+            main.purge_expired_sessions()
+            seen["kept"] = "a" in main.SESSIONS
+
+        async def waiter():
+            async with main.hold_session("a") as sess:
+                seen["waiter"] = sess
+
+        holder_task = asyncio.create_task(holder())
+        await entered.wait()
+        waiter_task = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder_task, waiter_task)
+        return seen
+
+    seen = asyncio.run(scenario())
+    assert seen["kept"]
+    assert seen["waiter"] is seen["holder"]
+    assert main.INFLIGHT == {}